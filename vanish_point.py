@@ -1,3 +1,4 @@
+import os
 import sys
 import numpy as np
 import cv2
@@ -6,13 +7,125 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                             QHBoxLayout, QPushButton, QLabel, QFileDialog, 
                             QListWidget, QInputDialog, QColorDialog, 
                             QMessageBox, QMenu, QListWidgetItem, QAction)
-from PyQt5.QtGui import QPixmap, QImage, QPainter, QPen, QColor, QCursor, QDrag, QBrush
-from PyQt5.QtCore import Qt, QPoint, QRect, QMimeData, QByteArray, QDataStream, QIODevice
+from PyQt5.QtGui import QPixmap, QImage, QPainter, QPen, QColor, QCursor, QDrag, QBrush, QPolygon, QPainterPath, QPixmapCache
+from PyQt5.QtCore import Qt, QPoint, QPointF, QRect, QLineF, QTimer, QMimeData, QByteArray, QDataStream, QIODevice
+
+try:
+    from numba import njit
+except ImportError:
+    # numba 为可选依赖，缺失时以下几何函数按普通Python函数执行
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+_EYE3 = np.eye(3)
+
+def build_perspective_maps(matrix, size):
+    """由透视矩阵（源->目标）生成cv2.remap使用的定点映射表"""
+    # 相机内参取单位阵、旋转取透视矩阵时，映射表即逐像素的 H^-1 * (u, v, 1)
+    return cv2.initUndistortRectifyMap(_EYE3, None, np.float64(matrix), _EYE3, size, cv2.CV_16SC2)
+
+def image_view(qimg):
+    """32位QImage像素的只读NumPy视图 (h, w, 4)，按bytesPerLine处理行填充，不复制数据"""
+    ptr = qimg.constBits()  # 只读访问，bits()会使cacheKey变化
+    ptr.setsize(qimg.sizeInBytes())
+    arr = np.frombuffer(ptr, np.uint8).reshape(qimg.height(), qimg.bytesPerLine() // 4, 4)
+    return arr[:, :qimg.width()]
+
+# 2点透视角点关系表：拖动的角点 -> (沿VP1方向的相邻角点, 宽度方向符号,
+# 沿VP2方向的相邻角点, 高度方向符号, 对角点, 求对角点时是否先取指向VP1的线)
+# 角点顺序：0左上、1右上、2右下、3左下
+_QUAD_ADJ = (
+    (1, 1, 3, 1, 2, 0),
+    (0, -1, 2, 1, 3, 0),
+    (3, -1, 1, -1, 0, 1),
+    (2, 1, 0, -1, 1, 1),
+)
+
+@njit(cache=True)
+def _line_intersection_raw(x1, y1, x2, y2, x3, y3, x4, y4):
+    """计算直线(x1,y1)-(x2,y2)与直线(x3,y3)-(x4,y4)的交点，平行时返回(x2,y2)"""
+    den = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
+    if den == 0:
+        return int(x2), int(y2)  # 平行线，返回终点
+    
+    t = ((x1 - x3) * (y3 - y4) - (y1 - y3) * (x3 - x4)) / den
+    return int(x1 + t * (x2 - x1)), int(y1 + t * (y2 - y1))
+
+@njit(cache=True)
+def _along_line_raw(sx, sy, ex, ey, length):
+    """从(sx,sy)指向(ex,ey)的方向上，自终点再移动length，返回整数坐标"""
+    dx = ex - sx
+    dy = ey - sy
+    if dx == 0 and dy == 0:
+        return int(ex), int(ey)
+    
+    ratio = length / math.hypot(dx, dy)
+    return int(ex + dx * ratio), int(ey + dy * ratio)
+
+@njit(cache=True)
+def _vanishing_point_raw(x1, y1, x2, y2, x3, y3, x4, y4):
+    """两条直线的交点作为消失点，平行时返回远处点(10000, 10000)"""
+    if (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4) == 0:
+        return 10000, 10000
+    return _line_intersection_raw(x1, y1, x2, y2, x3, y3, x4, y4)
+
+@njit(cache=True)
+def _solve_quad(drag_idx, px, py, v1x, v1y, v2x, v2y, w, h):
+    """由拖动的角点和两个消失点求四边形角点，返回 [x0, y0, x1, y1, x2, y2, x3, y3]"""
+    n1, sign_w, n2, sign_h, opposite, vp1_first = _QUAD_ADJ[drag_idx]
+    
+    # 相邻角点分别与VP1、VP2共线
+    ax, ay = _along_line_raw(v1x, v1y, px, py, sign_w * w)
+    bx, by = _along_line_raw(v2x, v2y, px, py, sign_h * h)
+    
+    # 对角点由两个相邻角点与另一个消失点的连线相交确定
+    if vp1_first:
+        ox, oy = _line_intersection_raw(bx, by, v1x, v1y, ax, ay, v2x, v2y)
+    else:
+        ox, oy = _line_intersection_raw(ax, ay, v2x, v2y, bx, by, v1x, v1y)
+    
+    quad = np.empty(8, dtype=np.int64)
+    quad[2 * drag_idx] = px
+    quad[2 * drag_idx + 1] = py
+    quad[2 * n1] = ax
+    quad[2 * n1 + 1] = ay
+    quad[2 * n2] = bx
+    quad[2 * n2 + 1] = by
+    quad[2 * opposite] = ox
+    quad[2 * opposite + 1] = oy
+    return quad
+
+def _line_distance(x, y, x1, y1, x2, y2):
+    """点(x,y)到直线(x1,y1)-(x2,y2)的距离，两点重合时返回inf"""
+    # 直线方程：ax + by + c = 0
+    a = y2 - y1
+    b = x1 - x2
+    c = x2*y1 - x1*y2
+    den = a*a + b*b
+    if den == 0:
+        return math.inf
+    return abs(a*x + b*y + c) / math.sqrt(den)
 
 class PerspectiveLayer:
 
 
     """图层类，存储每个图层的信息"""
+    # 使用__slots__省去每个实例的__dict__，属性访问也更快
+    __slots__ = ('name', 'original_image', 'warped_image', 'visible', 'points',
+                 'warp_points', 'z_order', 'opacity', 'selection_points', 'position',
+                 'source_vp', 'original_width', 'original_height', 'drag_offset',
+                 'layer_drag_mode', 'layer_scale', 'layer_position', 'drag_layer_image',
+                 'drag_layer_size', '_drag_is_preview', '_selection_cache', '_drag_copy_key',
+                 '_scaled_pixmap', '_scaled_key', '_cv_original', '_cv_original_key',
+                 '_mask_buf', '_warp_buf', '_warped_np',
+                 'initial_center', 'initial_vp1_distance', 'initial_vp2_distance',
+                 '_points_np', '_sel_np', '_warp_np', '_sel_polygon',
+                 '_radial_lines', '_radial_key', '_points_path', '_warp_path',
+                 '_map1', '_map2', '_map_matrix', '_map_size',
+                 '_drag_map1', '_drag_map2', '_drag_map_key', '_bbox')
+
     def __init__(self, name, image=None):
         self.name = name
         self.original_image = image  # 原始图像
@@ -32,11 +145,138 @@ class PerspectiveLayer:
         self.layer_scale = 1.0       # 图层缩放比例
         self.layer_position = QPoint(0, 0) # 图层拖拽位置
         self.drag_layer_image = None # 拖拽图层图像
+        self.drag_layer_size = None  # 拖拽图层在场景中的尺寸 (宽, 高)，预览图像可能比它小
+        self._drag_is_preview = False  # 拖拽图层图像是否为降采样预览
+        self._selection_cache = None  # (选区坐标, 排序后的点, 边界框)
+        self._drag_copy_key = None   # 生成当前drag_layer_image时的选区、背景和采样参数
+        self._scaled_pixmap = None   # 按layer_scale预先缩放好的拖拽图层
+        self._scaled_key = None      # (拖拽图像cacheKey, 缩放比例)
+        self._cv_original = None     # original_image转换好的OpenCV图像
+        self._cv_original_key = None # _cv_original对应的original_image cacheKey
+        self._mask_buf = None        # 复制选区时复用的单通道掩码缓冲区
+        self._warp_buf = None        # 复制选区时复用的变换输出缓冲区（空闲的一块）
+        self._warped_np = None       # drag_layer_image直接引用的像素缓冲区，须与图像同生命周期
         self.initial_center = QPoint(0, 0)  # 初始中心点
+        self.initial_vp1_distance = 1.0  # 初始到VP1的距离
         self.initial_vp2_distance = 1.0  # 初始到VP2的距离
+        self._points_np = None       # points 的NumPy缓存 (N,2) int64
+        self._sel_np = None          # selection_points 的NumPy缓存
+        self._warp_np = None         # warp_points 的NumPy缓存
+        self._sel_polygon = None     # 选区四边形的QPolygon缓存
+        self._radial_lines = None    # 消失点辐射线缓存 (VP1线, VP2线)
+        self._radial_key = None      # 辐射线缓存对应的消失点坐标
+        self._points_path = None     # 控制点圆点的QPainterPath缓存
+        self._warp_path = None       # 变换控制点圆点的QPainterPath缓存
+        self._map1 = None            # 上次透视变换的remap映射表
+        self._map2 = None
+        self._map_matrix = None      # 映射表对应的透视矩阵
+        self._map_size = None        # 映射表对应的输出尺寸
+        self._drag_map1 = None       # 复制选区用的remap映射表
+        self._drag_map2 = None
+        self._drag_map_key = None    # 映射表对应的 (宽, 高, 矩阵字节)
+        self._bbox = None            # 图层包围盒 (x0, y0, x1, y1)，无图像时为None
+        self.update_bbox()
+
+    def update_bbox(self):
+        """position 或 warped_image 变化后重新计算包围盒"""
+        image = self.warped_image
+        if image:
+            x, y = self.position.x(), self.position.y()
+            self._bbox = (x, y, x + image.width(), y + image.height())
+        else:
+            self._bbox = None
+
+    def invalidate_points_cache(self):
+        """点列表被修改后调用，使NumPy缓存失效"""
+        self._points_np = None
+        self._sel_np = None
+        self._warp_np = None
+        self._sel_polygon = None
+        self._selection_cache = None
+        self._radial_lines = None
+        self._points_path = None
+        self._warp_path = None
+
+    @staticmethod
+    def _to_np(points):
+        """将QPoint列表转换为 (N,2) 整数数组（int64，远处的点求平方距离时不会溢出）"""
+        return np.array([[p.x(), p.y()] for p in points], dtype=np.int64).reshape(-1, 2)
+
+    def original_array(self):
+        """original_image对应的RGBA字节顺序的OpenCV图像，图像变化后才重新生成"""
+        key = self.original_image.cacheKey()
+        if self._cv_original_key != key:
+            qimg = self.original_image
+            if qimg.format() == QImage.Format_RGBA8888:
+                # 上传时已转换：直接引用原图的像素内存
+                self._cv_original = image_view(qimg)
+            else:
+                # 临时转换的图像随即释放，须复制出像素
+                qimg = qimg.convertToFormat(QImage.Format_RGBA8888)
+                self._cv_original = image_view(qimg).copy()
+            self._cv_original_key = key
+        return self._cv_original
+    
+    def points_np(self):
+        """透视控制点数组（按需重建）"""
+        if self._points_np is None:
+            self._points_np = self._to_np(self.points)
+        return self._points_np
+
+    def selection_np(self):
+        """选区点数组（按需重建）"""
+        if self._sel_np is None:
+            self._sel_np = self._to_np(self.selection_points)
+        return self._sel_np
+
+    def warp_np(self):
+        """变换控制点数组（按需重建）"""
+        if self._warp_np is None:
+            self._warp_np = self._to_np(self.warp_points)
+        return self._warp_np
+
+    def selection_polygon(self):
+        """选区四边形（按需重建）"""
+        if self._sel_polygon is None:
+            self._sel_polygon = QPolygon(self.selection_points)
+        return self._sel_polygon
+
+    @staticmethod
+    def _dots_path(points):
+        """把每个点画成半径1像素的圆点，合并为一条路径"""
+        path = QPainterPath()
+        path.setFillRule(Qt.WindingFill)  # 重叠的圆点不会互相挖空
+        for p in points:
+            path.addEllipse(QPointF(p), 1, 1)
+        return path
+
+    def points_path(self):
+        """控制点圆点路径（按需重建）"""
+        if self._points_path is None:
+            self._points_path = self._dots_path(self.points)
+        return self._points_path
+
+    def warp_path(self):
+        """变换控制点圆点路径（按需重建）"""
+        if self._warp_path is None:
+            self._warp_path = self._dots_path(self.warp_points)
+        return self._warp_path
+
+    def radial_lines(self, grid, vp1, vp2, width, height):
+        """从两个消失点到控制点的辐射线（控制点或消失点变化时重建）"""
+        key = (vp1.x(), vp1.y(), vp2.x(), vp2.y())
+        if self._radial_lines is None or self._radial_key != key:
+            points = self.points_np()
+            self._radial_lines = (grid.calculate_radial_lines(vp1, width, height, points),
+                                  grid.calculate_radial_lines(vp2, width, height, points))
+            self._radial_key = key
+        return self._radial_lines
 
 class PerspectiveGrid:
     """透视网格类，管理透视网格的绘制和消失点计算"""
+    __slots__ = ('vanishing_points', 'grid_color', 'grid_size', 'line_count',
+                 'enabled', 'primary_vp', '_last_pts_hash', '_last_vp')
+
     def __init__(self):
         self.vanishing_points = []  # 消失点
         self.grid_color = QColor(255, 0, 0, 100)  # 网格颜色
@@ -44,57 +284,52 @@ class PerspectiveGrid:
         self.line_count = 15  # 从消失点发出的线数量
         self.enabled = True  # 是否显示网格
         self.primary_vp = []  # 主要消失点（用于2点透视）
+        self._last_pts_hash = None  # 上次计算消失点时的控制点坐标
+        self._last_vp = []  # 上次计算得到的消失点
         
     def calculate_two_point_perspective(self, points):
         """计算2点透视的消失点"""
         if len(points) != 4:
             return []
+        
+        # 控制点未变化时直接复用上次的结果
+        key = tuple((p.x(), p.y()) for p in points)
+        if key == self._last_pts_hash:
+            self.primary_vp = self._last_vp
+            return self.primary_vp
             
         # 提取四个点，假设是一个矩形在2点透视下的投影
-        p1, p2, p3, p4 = points
+        (x1, y1), (x2, y2), (x3, y3), (x4, y4) = key
         
         # 计算两组平行线的交点作为消失点（2点透视）
-        vp1 = self.line_intersection(p1, p2, p3, p4)  # 水平方向消失点
-        vp2 = self.line_intersection(p2, p3, p4, p1)  # 垂直方向消失点
+        v1x, v1y = _vanishing_point_raw(x1, y1, x2, y2, x3, y3, x4, y4)  # 水平方向消失点
+        v2x, v2y = _vanishing_point_raw(x2, y2, x3, y3, x4, y4, x1, y1)  # 垂直方向消失点
         
         # 验证消失点有效性
-        valid_vp1 = not (abs(vp1.x()) < 10 and abs(vp1.y()) < 10)
-        valid_vp2 = not (abs(vp2.x()) < 10 and abs(vp2.y()) < 10)
+        valid_vp1 = not (abs(v1x) < 10 and abs(v1y) < 10)
+        valid_vp2 = not (abs(v2x) < 10 and abs(v2y) < 10)
         
-        self.primary_vp = [vp1, vp2] if valid_vp1 and valid_vp2 else []
+        self.primary_vp = [QPoint(v1x, v1y), QPoint(v2x, v2y)] if valid_vp1 and valid_vp2 else []
+        self._last_pts_hash = key
+        self._last_vp = self.primary_vp
         return self.primary_vp
     
-    def line_intersection(self, a1, a2, b1, b2):
-        """计算两条线的交点"""
-        x1, y1 = a1.x(), a1.y()
-        x2, y2 = a2.x(), a2.y()
-        x3, y3 = b1.x(), b1.y()
-        x4, y4 = b2.x(), b2.y()
-        
-        # 计算分母
-        den = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
-        if den == 0:
-            return QPoint(10000, 10000)  # 平行线，返回远处点
-        
-        # 计算交点
-        t_num = (x1 - x3) * (y3 - y4) - (y1 - y3) * (x3 - x4)
-        t = t_num / den
-        
-        x = x1 + t * (x2 - x1)
-        y = y1 + t * (y2 - y1)
-        
-        return QPoint(int(x), int(y))
-    
     def calculate_radial_lines(self, vp, width, height, control_points):
         """计算从消失点发出的辐射线 - 只连接到控制点，不生成额外延长线"""
-        lines = []
-        vp_x, vp_y = vp.x(), vp.y()
+        # control_points 可以是QPoint列表，也可以是 (N,2) 数组
+        if not isinstance(control_points, np.ndarray):
+            control_points = np.fromiter(
+                (v for pt in control_points for v in (pt.x(), pt.y())),
+                dtype=np.float64, count=2 * len(control_points)).reshape(-1, 2)
+        
+        # 每行为 [vp_x, vp_y, px, py]
+        rows = np.empty((len(control_points), 4), dtype=np.float64)
+        rows[:, 0] = vp.x()
+        rows[:, 1] = vp.y()
+        rows[:, 2:] = control_points
         
         # 只添加连接消失点和每个控制点的线
-        for pt in control_points:
-            lines.append((QPoint(vp_x, vp_y), pt))
-            
-        return lines
+        return [QLineF(*row) for row in rows.tolist()]
 
 class Canvas(QLabel):
     """绘图区域类，负责显示和处理图像"""
@@ -112,24 +347,69 @@ class Canvas(QLabel):
         self.dragging_edge = -1  # 正在拖动的边索引
         self.dragging_layer = -1  # 正在拖动的图层索引
         self.edge_drag_offset = QPoint()  # 拖动边时的偏移量
+        self._pending_warp = None  # 待执行的透视变换 (图层, 角点索引, 场景坐标)
+        self._warp_scheduled = False  # 是否已安排_flush_warp
+        self._last_state_hash = None  # 上次重绘时的图层状态，见_update_if_changed
+        self._background_key = None  # 作为背景加载的图层原图的cacheKey
+        self._source_image = None  # 背景图转成的32位QImage，复制选区时使用
+        self._source_key = None  # _source_image对应的pixmap cacheKey
+        self._cv_source = None  # _source_image像素的NumPy视图（BGRA字节顺序）
+        self.interactive = True  # 交互预览使用双线性插值，确认渲染时才用Lanczos
+        self.drag_preview_scale = 0.5  # 进入图层拖拽时先生成的预览图像比例，松开鼠标后再生成原分辨率
+        
+        # 绘制用的画笔和画刷，只创建一次，各帧复用
+        self._pen_selection = QPen(QColor(0, 255, 255, 200), 2, Qt.DashLine)
+        self._brush_selection = QBrush(QColor(0, 255, 255, 30))  # 半透明青色
+        self._pen_green = QPen(QColor(0, 255, 0), 1)  # 绿色边框
+        self._brush_green = QBrush(QColor(0, 255, 0, 200))  # 半透明绿色填充
+        self._pen_red = QPen(QColor(255, 0, 0), 1)
+        self._brush_red = QBrush(QColor(255, 0, 0, 200))
+        self._pen_blue = QPen(QColor(0, 0, 255), 1)  # 蓝色边框
+        self._brush_blue = QBrush(QColor(0, 0, 255, 200))  # 半透明蓝色填充
+        self._pen_grid_vp1 = QPen(QColor(255, 0, 0, 100), 1)
+        self._pen_grid_vp2 = QPen(QColor(0, 0, 255, 100), 1)
         
         # 设置右键菜单
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.show_context_menu)
         
+    def source_image(self):
+        """背景图的32位QImage，每次加载图像后只转换一次"""
+        key = self.pixmap.cacheKey()
+        if self._source_key != key:
+            image = self.pixmap.toImage()
+            # 拖拽图层为ARGB32_Premultiplied（内存中BGRA），源图也须是BGRA字节顺序
+            if image.format() not in (QImage.Format_RGB32, QImage.Format_ARGB32,
+                                      QImage.Format_ARGB32_Premultiplied):
+                image = image.convertToFormat(QImage.Format_ARGB32)
+            self._source_image = image
+            # 变换与通道无关，不做颜色转换，直接使用像素内存
+            self._cv_source = image_view(image)
+            self._source_key = key
+        return self._source_image
+    
+    def source_array(self):
+        """背景图对应的OpenCV图像，每次加载图像后只生成一次"""
+        self.source_image()
+        return self._cv_source
+    
     def show_context_menu(self, position):
         """显示右键菜单"""
         menu = QMenu()
         layer_drag_action = QAction("图层拖拽", self)
         
         layer_drag_action.triggered.connect(self.toggle_layer_drag_mode)
+        commit_action = QAction("高质量渲染", self)
+        commit_action.triggered.connect(self.commit_drag_layer)
         
         menu.addAction(layer_drag_action)
+        menu.addAction(commit_action)
         menu.exec_(self.mapToGlobal(position))
     
-    def load_image(self, image_path):
-        """加载图像"""
+    def load_image(self, image_path, layer_image=None):
+        """加载图像；layer_image为与背景相同的图层原图时，记录下来供快速路径判断"""
         self.pixmap.load(image_path)
+        self._background_key = layer_image.cacheKey() if layer_image is not None else None
         self.update()
         
     def paintEvent(self, event):
@@ -146,143 +426,146 @@ class Canvas(QLabel):
         painter.scale(self.scale_factor, self.scale_factor)
         
         # 绘制背景图像
-        if not self.pixmap.isNull():
-            painter.drawPixmap(0, 0, self.pixmap)
+        painter.drawPixmap(0, 0, self.pixmap)
+        
+        # 快速路径：没有图层内容、网格、选区和各类点时只需绘制背景
+        if not self._needs_compositor():
+            return
         
         # 绘制图层（按z_order排序）
         self.parent.draw_layers(painter)
         
+        # 每帧只取一次当前图层和消失点，传给各绘制函数
+        current_layer = self.parent.get_current_layer()
+        primary_vp = self.parent.grid.primary_vp
+        
         # 绘制透视网格
         if self.parent.grid.enabled:
-            self.draw_grid(painter)
+            self.draw_grid(painter, current_layer, primary_vp)
         
         # 如果不是图层拖拽模式，绘制选区
-        current_layer = self.parent.get_current_layer()
         if not current_layer or not current_layer.layer_drag_mode:
-            self.draw_selection(painter)
+            self.draw_selection(painter, current_layer)
         
         # 绘制点和消失点
-        self.draw_points(painter)
+        self.draw_points(painter, current_layer, primary_vp)
+    
+    def _needs_compositor(self):
+        """判断背景之上是否还有需要绘制的内容"""
+        layers = self.parent.layers
+        if len(layers) > 1 or self.parent.grid.primary_vp:
+            return True
+        for layer in layers:
+            if layer.points or layer.selection_points or layer.warp_points:
+                return True
+            if layer.visible and (layer.warped_image or layer.drag_layer_image):
+                if not self._covered_by_background(layer):
+                    return True
+        return False
+    
+    def _covered_by_background(self, layer):
+        """图层只是原位、不透明地显示背景图本身时，背景绘制已经覆盖了它"""
+        # 带透明度的图像叠画两次与只画一次结果不同，不能省略
+        image = layer.warped_image
+        return (image is not None and not layer.layer_drag_mode and
+                self._background_key is not None and
+                not self.pixmap.hasAlphaChannel() and
+                image.cacheKey() == self._background_key and
+                layer.position == QPoint(0, 0) and layer.opacity == 1.0)
     
-    def draw_selection(self, painter):
+    def draw_selection(self, painter, current_layer):
         """绘制四边形选区"""
-        current_layer = self.parent.get_current_layer()
         if not current_layer or len(current_layer.selection_points) < 4:
             return
             
-        # 绘制选区边界
-        pen = QPen(QColor(0, 255, 255, 200), 2, Qt.DashLine)
-        painter.setPen(pen)
-        painter.setBrush(QColor(0, 255, 255, 30))  # 半透明青色
+        # 绘制并填充选区（虚线边界由drawPolygon一次完成）
+        painter.setPen(self._pen_selection)
+        painter.setBrush(self._brush_selection)
+        painter.drawPolygon(current_layer.selection_polygon())
         
-        # 绘制四边形
         points = current_layer.selection_points
-        for i in range(4):
-            painter.drawLine(points[i], points[(i+1)%4])
-        
-        # 填充选区
-        painter.drawPolygon([p for p in points])
         
         # 绘制控制点（顶点）- 改为圆点，半径为原来的1/4
-        pen = QPen(QColor(255, 0, 0), 1)
-        brush = QBrush(QColor(255, 0, 0, 200))
-        painter.setPen(pen)
-        painter.setBrush(brush)
+        painter.setPen(self._pen_red)
+        painter.setBrush(self._brush_red)
         for point in points:
             painter.drawEllipse(point, 1, 1)  # 选区控制点半径变为1.25
     
-    def draw_points(self, painter):
+    def draw_points(self, painter, current_layer, primary_vp):
         """绘制控制点和消失点"""
         # 绘制当前图层的控制点（绿色圆点）- 半径为原来的1/4
-        current_layer = self.parent.get_current_layer()
         if current_layer and not current_layer.layer_drag_mode:
-            pen = QPen(QColor(0, 255, 0), 1)  # 绿色边框
-            brush = QBrush(QColor(0, 255, 0, 200))  # 半透明绿色填充
-            painter.setPen(pen)
-            painter.setBrush(brush)
+            painter.setPen(self._pen_green)
+            painter.setBrush(self._brush_green)
             
-            for point in current_layer.points:
-                # 绘制圆点，半径为1像素
-                painter.drawEllipse(point, 1, 1)
-                
-                # 绘制点的编号
-                painter.drawText(point.x() + 3, point.y() - 3, 
-                                str(current_layer.points.index(point) + 1))
+            # 所有圆点（半径为1像素）合并为一条路径一次绘制
+            painter.drawPath(current_layer.points_path())
+            
+            # 绘制点的编号
+            for i, point in enumerate(current_layer.points):
+                painter.drawText(point.x() + 3, point.y() - 3, str(i + 1))
         
         # 绘制粘贴图层的变换控制点（蓝色圆点）- 半径为原来的1/4
-        for i, layer in enumerate(self.parent.layers):
-            if layer.warp_points and len(layer.warp_points) == 4 and layer.visible and not layer.layer_drag_mode:
-                pen = QPen(QColor(0, 0, 255), 1)  # 蓝色边框
-                brush = QBrush(QColor(0, 0, 255, 200))  # 半透明蓝色填充
-                painter.setPen(pen)
-                painter.setBrush(brush)
-                
-                for point in layer.warp_points:
-                    # 绘制圆点，半径为1像素
-                    painter.drawEllipse(point, 1, 1)
+        painter.setPen(self._pen_blue)
+        painter.setBrush(self._brush_blue)
+        layers = self.parent.layers
+        for layer in layers:
+            if len(layer.warp_points) == 4 and layer.visible and not layer.layer_drag_mode:
+                painter.drawPath(layer.warp_path())
         
         # 绘制消失点（2点透视专用颜色）- 改为圆点，半径为原来的1/4
-        if self.parent.grid.primary_vp:
+        if primary_vp:
             # 第一个消失点（红色圆点）- 水平方向
-            pen = QPen(QColor(255, 0, 0), 1)
-            brush = QBrush(QColor(255, 0, 0, 200))
-            painter.setPen(pen)
-            painter.setBrush(brush)
-            vp1 = self.parent.grid.primary_vp[0]
+            painter.setPen(self._pen_red)
+            painter.setBrush(self._brush_red)
+            vp1 = primary_vp[0]
             painter.drawEllipse(vp1, 1.5, 1.5)  # 消失点半径变为1.5
             painter.drawText(vp1.x() + 3, vp1.y() - 3, "VP1 (水平)")
             
             # 第二个消失点（蓝色圆点）- 深度方向
-            if len(self.parent.grid.primary_vp) > 1:
-                pen = QPen(QColor(0, 0, 255), 1)
-                brush = QBrush(QColor(0, 0, 255, 200))
-                painter.setPen(pen)
-                painter.setBrush(brush)
-                vp2 = self.parent.grid.primary_vp[1]
+            if len(primary_vp) > 1:
+                painter.setPen(self._pen_blue)
+                painter.setBrush(self._brush_blue)
+                vp2 = primary_vp[1]
                 painter.drawEllipse(vp2, 1.5, 1.5)
                 painter.drawText(vp2.x() + 3, vp2.y() - 3, "VP2 (深度)")
     
-    def draw_grid(self, painter):
+    def draw_grid(self, painter, current_layer, primary_vp):
         """绘制2点透视网格 - 只绘制连接到控制点的线"""
-        current_layer = self.parent.get_current_layer()
-        if not current_layer or len(current_layer.points) < 4 or not self.parent.grid.primary_vp:
+        if not current_layer or len(current_layer.points) < 4 or not primary_vp:
             return
             
         # 获取图像尺寸
         img_size = (self.pixmap.width(), self.pixmap.height())
         
         # 为两个消失点绘制网格线
-        if len(self.parent.grid.primary_vp) >= 2:
-            vp1, vp2 = self.parent.grid.primary_vp[:2]
+        if len(primary_vp) >= 2:
+            vp1, vp2 = primary_vp[0], primary_vp[1]
+            lines1, lines2 = current_layer.radial_lines(
+                self.parent.grid, vp1, vp2, img_size[0], img_size[1])
             
             # 从VP1发出的线（红色）- 水平方向，只连接到控制点
-            lines1 = self.parent.grid.calculate_radial_lines(vp1, img_size[0], img_size[1], current_layer.points)
-            pen = QPen(QColor(255, 0, 0, 100), 1)
-            painter.setPen(pen)
-            for line in lines1:
-                painter.drawLine(line[0], line[1])
+            painter.setPen(self._pen_grid_vp1)
+            painter.drawLines(lines1)
                 
             # 从VP2发出的线（蓝色）- 深度方向，只连接到控制点
-            lines2 = self.parent.grid.calculate_radial_lines(vp2, img_size[0], img_size[1], current_layer.points)
-            pen = QPen(QColor(0, 0, 255, 100), 1)
-            painter.setPen(pen)
-            for line in lines2:
-                painter.drawLine(line[0], line[1])
+            painter.setPen(self._pen_grid_vp2)
+            painter.drawLines(lines2)
     
     def distance_point_to_line(self, point, line_start, line_end):
         """计算点到直线的距离"""
-        x, y = point.x(), point.y()
-        x1, y1 = line_start.x(), line_start.y()
-        x2, y2 = line_end.x(), line_end.y()
-        
-        # 直线方程：ax + by + c = 0
-        a = y2 - y1
-        b = x1 - x2
-        c = x2*y1 - x1*y2
-        
-        # 计算距离
-        distance = abs(a*x + b*y + c) / np.sqrt(a**2 + b**2) if (a**2 + b**2) > 0 else float('inf')
-        return distance
+        return _line_distance(point.x(), point.y(), line_start.x(), line_start.y(),
+                              line_end.x(), line_end.y())
+    
+    def find_closest_index(self, arr, pos):
+        """在 (N,2) 点数组中找到离pos最近且距离小于10像素的点索引"""
+        if len(arr) == 0:
+            return -1
+        dx = arr[:, 0] - pos.x()
+        dy = arr[:, 1] - pos.y()
+        d2 = dx * dx + dy * dy
+        i = int(d2.argmin())
+        return i if d2[i] < 100 else -1  # 最小距离阈值10像素，比较平方距离
     
     def find_closest_point(self, pos):
         """找到离pos最近的选区点"""
@@ -290,16 +573,7 @@ class Canvas(QLabel):
         if not current_layer or len(current_layer.selection_points) < 4:
             return -1
             
-        min_dist = 10  # 最小距离阈值（像素）
-        closest_idx = -1
-        
-        for i, point in enumerate(current_layer.selection_points):
-            dist = np.hypot(point.x() - pos.x(), point.y() - pos.y())
-            if dist < min_dist:
-                min_dist = dist
-                closest_idx = i
-                
-        return closest_idx
+        return self.find_closest_index(current_layer.selection_np(), pos)
     
     def find_closest_warp_point(self, pos):
         """找到离pos最近的变换控制点"""
@@ -307,16 +581,7 @@ class Canvas(QLabel):
         if not current_layer or len(current_layer.warp_points) < 4:
             return -1
             
-        min_dist = 10  # 最小距离阈值（像素）
-        closest_idx = -1
-        
-        for i, point in enumerate(current_layer.warp_points):
-            dist = np.hypot(point.x() - pos.x(), point.y() - pos.y())
-            if dist < min_dist:
-                min_dist = dist
-                closest_idx = i
-                
-        return closest_idx
+        return self.find_closest_index(current_layer.warp_np(), pos)
     
     def find_closest_control_point(self, pos):
         """找到离pos最近的透视控制点（绿色点）"""
@@ -324,16 +589,7 @@ class Canvas(QLabel):
         if not current_layer or len(current_layer.points) < 1:
             return -1
             
-        min_dist = 10  # 最小距离阈值（像素）
-        closest_idx = -1
-        
-        for i, point in enumerate(current_layer.points):
-            dist = np.hypot(point.x() - pos.x(), point.y() - pos.y())
-            if dist < min_dist:
-                min_dist = dist
-                closest_idx = i
-                
-        return closest_idx
+        return self.find_closest_index(current_layer.points_np(), pos)
     
     def find_closest_edge(self, pos):
         """找到离pos最近的选区边"""
@@ -341,26 +597,31 @@ class Canvas(QLabel):
         if not current_layer or len(current_layer.selection_points) < 4:
             return -1, QPoint()
             
-        min_dist = 10  # 最小距离阈值（像素）
+        min_dist2 = 100  # 最小距离阈值（10像素）的平方
         closest_idx = -1
         closest_point = QPoint()
+        x, y = pos.x(), pos.y()
         
         for i in range(4):
             p1 = current_layer.selection_points[i]
             p2 = current_layer.selection_points[(i+1)%4]
+            x1, y1 = p1.x(), p1.y()
+            x2, y2 = p2.x(), p2.y()
             
-            dist = self.distance_point_to_line(pos, p1, p2)
-            if dist < min_dist:
-                min_dist = dist
+            # 比较点到直线距离的平方：num^2 < min_dist2 * (a^2 + b^2)，无需开方
+            a = y2 - y1
+            b = x1 - x2
+            den = a*a + b*b
+            if den == 0:
+                continue
+            num = a*x + b*y + x2*y1 - x1*y2
+            num2 = num * num
+            if num2 < min_dist2 * den:
+                min_dist2 = num2 / den
                 closest_idx = i
                 
                 # 计算投影点
-                x, y = pos.x(), pos.y()
-                x1, y1 = p1.x(), p1.y()
-                x2, y2 = p2.x(), p2.y()
-                
-                t = ((x - x1)*(x2 - x1) + (y - y1)*(y2 - y1)) / \
-                    ((x2 - x1)**2 + (y2 - y1)** 2 + 1e-8)
+                t = ((x - x1)*(x2 - x1) + (y - y1)*(y2 - y1)) / (den + 1e-8)
                 t = max(0, min(1, t))
                 
                 proj_x = x1 + t*(x2 - x1)
@@ -371,15 +632,15 @@ class Canvas(QLabel):
     
     def find_layer_at_pos(self, pos):
         """找到pos位置的图层"""
+        x, y = pos.x(), pos.y()
+        bboxes, visible = self.parent.layer_hit_arrays()
+        # 一次性检查点是否在各图层包围盒内
+        mask = ((bboxes[:, 0] <= x) & (x < bboxes[:, 2]) &
+                (bboxes[:, 1] <= y) & (y < bboxes[:, 3]) & visible)
+        if not mask.any():
+            return -1
         # 从顶层往下找
-        for i in reversed(range(len(self.parent.layers))):
-            layer = self.parent.layers[i]
-            if layer.visible and layer.warped_image:
-                # 检查点是否在图层范围内
-                if (0 <= pos.x() - layer.position.x() < layer.warped_image.width() and
-                    0 <= pos.y() - layer.position.y() < layer.warped_image.height()):
-                    return i
-        return -1
+        return len(mask) - 1 - int(mask[::-1].argmax())
     
     def mousePressEvent(self, event):
         """鼠标按下事件"""
@@ -389,8 +650,10 @@ class Canvas(QLabel):
             
         # 转换坐标考虑缩放和偏移
         scene_pos = self.transform_pos(event.pos())
+        self._last_state_hash = None  # 新的拖动从头比较状态
         
         if event.button() == Qt.LeftButton:
+            layers = self.parent.layers
             # 检查是否在图层拖拽模式
             if current_layer.layer_drag_mode and current_layer.drag_layer_image:
                 # 检查是否点击了图层
@@ -439,7 +702,7 @@ class Canvas(QLabel):
                     dx = p2.y() - p1.y()
                     dy = p1.x() - p2.x()
                     if dx != 0 or dy != 0:
-                        length = np.sqrt(dx**2 + dy**2)
+                        length = math.hypot(dx, dy)
                         dx_normalized = dx / length
                         dy_normalized = dy / length
                         
@@ -467,6 +730,7 @@ class Canvas(QLabel):
                     # 同时设置为选区点
                     if len(current_layer.selection_points) < 4:
                         current_layer.selection_points.append(scene_pos)
+                    current_layer.invalidate_points_cache()
                     
                     self.update()
                     
@@ -485,7 +749,7 @@ class Canvas(QLabel):
                     # 准备拖动图层
                     self.dragging_layer = layer_idx
                     self.dragging_view = True
-                    layer = self.parent.layers[layer_idx]
+                    layer = layers[layer_idx]
                     layer.drag_offset = QPoint(
                         scene_pos.x() - layer.position.x(),
                         scene_pos.y() - layer.position.y()
@@ -502,8 +766,8 @@ class Canvas(QLabel):
             return False
             
         # 计算图层边界
-        layer_width = layer.drag_layer_image.width() * layer.layer_scale
-        layer_height = layer.drag_layer_image.height() * layer.layer_scale
+        layer_width = layer.drag_layer_size[0] * layer.layer_scale
+        layer_height = layer.drag_layer_size[1] * layer.layer_scale
         
         layer_left = layer.layer_position.x() - layer_width / 2
         layer_top = layer.layer_position.y() - layer_height / 2
@@ -525,83 +789,29 @@ class Canvas(QLabel):
             if self.dragging_point != -1:
                 # 拖动顶点（透视约束处理）
                 if current_layer.warp_points and len(current_layer.warp_points) >= 4 and current_layer.source_vp:
-                    # 2点透视约束下的点拖动逻辑
-                    vp1, vp2 = current_layer.source_vp[:2]
-                    drag_idx = self.dragging_point
-                    
-                    # 更新当前拖动的点
-                    current_layer.warp_points[drag_idx] = scene_pos
-                    
-                    # 根据2点透视规则更新其他点
-                    if drag_idx == 0:  # 左上角点
-                        # 右上角点应保持与VP1共线
-                        p1 = current_layer.warp_points[0]
-                        p2 = self.get_point_along_line(vp1, p1, current_layer.original_width)
-                        current_layer.warp_points[1] = p2
-                        
-                        # 左下角点应保持与VP2共线
-                        p3 = self.get_point_along_line(vp2, p1, current_layer.original_height)
-                        current_layer.warp_points[3] = p3
-                        
-                        # 右下角点由右上角和左下角点确定
-                        current_layer.warp_points[2] = self.line_intersection(p2, vp2, p3, vp1)
-                        
-                    elif drag_idx == 1:  # 右上角点
-                        # 左上角点应保持与VP1共线
-                        p2 = current_layer.warp_points[1]
-                        p1 = self.get_point_along_line(vp1, p2, -current_layer.original_width)
-                        current_layer.warp_points[0] = p1
-                        
-                        # 右下角点应保持与VP2共线
-                        p3 = self.get_point_along_line(vp2, p2, current_layer.original_height)
-                        current_layer.warp_points[2] = p3
-                        
-                        # 左下角点由左上角和右下角点确定
-                        current_layer.warp_points[3] = self.line_intersection(p1, vp2, p3, vp1)
-                        
-                    elif drag_idx == 2:  # 右下角点
-                        # 左下角点应保持与VP1共线
-                        p3 = current_layer.warp_points[2]
-                        p4 = self.get_point_along_line(vp1, p3, -current_layer.original_width)
-                        current_layer.warp_points[3] = p4
-                        
-                        # 右上角点应保持与VP2共线
-                        p2 = self.get_point_along_line(vp2, p3, -current_layer.original_height)
-                        current_layer.warp_points[1] = p2
-                        
-                        # 左上角点由右上角和左下角点确定
-                        current_layer.warp_points[0] = self.line_intersection(p2, vp1, p4, vp2)
-                        
-                    elif drag_idx == 3:  # 左下角点
-                        # 右下角点应保持与VP1共线
-                        p4 = current_layer.warp_points[3]
-                        p3 = self.get_point_along_line(vp1, p4, current_layer.original_width)
-                        current_layer.warp_points[2] = p3
-                        
-                        # 左上角点应保持与VP2共线
-                        p1 = self.get_point_along_line(vp2, p4, -current_layer.original_height)
-                        current_layer.warp_points[0] = p1
-                        
-                        # 右上角点由左上角和右下角点确定
-                        current_layer.warp_points[1] = self.line_intersection(p1, vp1, p3, vp2)
-                        
-                    # 应用透视变换
-                    self.parent.apply_perspective_to_layer(current_layer)
+                    # 2点透视约束下的点拖动：只记录最新位置，连续的移动事件合并为一次变换
+                    self._pending_warp = (current_layer, self.dragging_point, scene_pos)
+                    if not self._warp_scheduled:
+                        self._warp_scheduled = True
+                        QTimer.singleShot(0, self._flush_warp)
+                    return
                 elif current_layer.selection_points and len(current_layer.selection_points) >= 4:
                     # 拖动选区点，同时更新对应的透视控制点
                     current_layer.selection_points[self.dragging_point] = scene_pos
                     if len(current_layer.points) > self.dragging_point:
                         current_layer.points[self.dragging_point] = scene_pos
+                    current_layer.invalidate_points_cache()
                 elif current_layer.points and len(current_layer.points) > 0:
                     # 拖动透视控制点，同时更新对应的选区点
                     current_layer.points[self.dragging_point] = scene_pos
                     if len(current_layer.selection_points) > self.dragging_point:
                         current_layer.selection_points[self.dragging_point] = scene_pos
+                    current_layer.invalidate_points_cache()
                     
                     # 重新计算消失点
                     if len(current_layer.points) == 4:
                         self.parent.grid.calculate_two_point_perspective(current_layer.points)
-                self.update()
+                self._update_if_changed(current_layer)
             elif self.dragging_edge != -1:
                 # 拖动边
                 idx1 = self.dragging_edge
@@ -620,7 +830,7 @@ class Canvas(QLabel):
                 perp_dx = dy
                 perp_dy = -dx
                 if perp_dx != 0 or perp_dy != 0:
-                    length = np.sqrt(perp_dx**2 + perp_dy**2)
+                    length = math.hypot(perp_dx, perp_dy)
                     perp_dx /= length
                     perp_dy /= length
                 
@@ -645,77 +855,66 @@ class Canvas(QLabel):
                     current_layer.points[idx1] = current_layer.selection_points[idx1]
                 if len(current_layer.points) > idx2:
                     current_layer.points[idx2] = current_layer.selection_points[idx2]
+                current_layer.invalidate_points_cache()
                 
                 # 重新计算消失点
                 if len(current_layer.points) == 4:
                     self.parent.grid.calculate_two_point_perspective(current_layer.points)
                 
-                self.update()
+                self._update_if_changed(current_layer)
             elif self.dragging_layer != -1:
                 # 拖动图层
                 layer = self.parent.layers[self.dragging_layer]
 
+                dirty_rect = None
                 if layer.layer_drag_mode and layer.drag_layer_image:
-                    # 图层拖拽模式：移动整个图层
+                    # 图层拖拽模式：移动整个图层，只需重绘新旧位置
+                    dirty_rect = self.drag_layer_screen_rect(layer)
                     layer.layer_position = QPoint(
                         scene_pos.x() - layer.drag_offset.x(),
                         scene_pos.y() - layer.drag_offset.y()
                     )
 
                     # 计算新的缩放比例
-                    if self.parent.grid.primary_vp and len(self.parent.grid.primary_vp) >= 2:
-                        vp1 = self.parent.grid.primary_vp[0]
-                        vp2 = self.parent.grid.primary_vp[1]
-                        current_center = layer.layer_position
-
-                        # 计算当前中心到两个消失点的距离
-                        dx1 = current_center.x() - vp1.x()
-                        dy1 = current_center.y() - vp1.y()
-                        current_vp1_distance = np.sqrt(dx1 * dx1 + dy1 * dy1)
+                    primary_vp = self.parent.grid.primary_vp
+                    if primary_vp and len(primary_vp) >= 2:
+                        vp1, vp2 = primary_vp[0], primary_vp[1]
+                        cx, cy = layer.layer_position.x(), layer.layer_position.y()
+                        ix, iy = layer.initial_center.x(), layer.initial_center.y()
+                        v1x, v1y = vp1.x(), vp1.y()
+                        v2x, v2y = vp2.x(), vp2.y()
 
-                        dx2 = current_center.x() - vp2.x()
-                        dy2 = current_center.y() - vp2.y()
-                        current_vp2_distance = np.sqrt(dx2 * dx2 + dy2 * dy2)
+                        # 向量A：从初始中心到当前中心；向量B1、B2：从初始中心到vp1、vp2
+                        ax, ay = cx - ix, cy - iy
+                        b1x, b1y = v1x - ix, v1y - iy
+                        b2x, b2y = v2x - ix, v2y - iy
 
-                        # 计算向量A：从初始中心到当前中心
-                        vector_A = current_center - layer.initial_center
-                        # 计算向量B1：从初始中心到vp1
-                        vector_B1 = vp1 - layer.initial_center
-                        # 计算向量B2：从初始中心到vp2
-                        vector_B2 = vp2 - layer.initial_center
+                        # 夹角越小余弦越大，比较 cos * |A| = dot / |B| 即可，无需atan2
+                        # （|B|为0时夹角按0处理，与atan2(0, 0)一致）
+                        len_a = math.hypot(ax, ay)
+                        len_b1 = math.hypot(b1x, b1y)
+                        len_b2 = math.hypot(b2x, b2y)
+                        cos1 = (ax * b1x + ay * b1y) / len_b1 if len_b1 else len_a
+                        cos2 = (ax * b2x + ay * b2y) / len_b2 if len_b2 else len_a
 
-                        # 计算向量A与向量B1的夹角（弧度）
-                        dot1 = vector_A.x() * vector_B1.x() + vector_A.y() * vector_B1.y()
-                        det1 = vector_A.x() * vector_B1.y() - vector_A.y() * vector_B1.x()
-                        angle1 = math.atan2(det1, dot1)
-
-                        # 计算向量A与向量B2的夹角（弧度）
-                        dot2 = vector_A.x() * vector_B2.x() + vector_A.y() * vector_B2.y()
-                        det2 = vector_A.x() * vector_B2.y() - vector_A.y() * vector_B2.x()
-                        angle2 = math.atan2(det2, dot2)
-
-                        # 取绝对值，得到0到π之间的角度
-                        angle1_abs = abs(angle1)
-                        angle2_abs = abs(angle2)
-
-                        # 选择夹角较小的消失点
-                        if angle1_abs < angle2_abs:
+                        # 选择夹角较小的消失点，按当前中心到该消失点的距离计算缩放
+                        if cos1 > cos2:
                             # 使用vp1
                             if layer.initial_vp1_distance != 0:
-                                scale_factor = current_vp1_distance / layer.initial_vp1_distance
+                                scale_factor = math.hypot(cx - v1x, cy - v1y) / layer.initial_vp1_distance
                             else:
                                 scale_factor = 1.0
                         else:
                             # 使用vp2
                             if layer.initial_vp2_distance != 0:
-                                scale_factor = current_vp2_distance / layer.initial_vp2_distance
+                                scale_factor = math.hypot(cx - v2x, cy - v2y) / layer.initial_vp2_distance
                             else:
                                 scale_factor = 1.0
 
                         # 限制缩放范围，例如在0.1到2.0之间
                         scale_factor = max(0.1, min(scale_factor, 2.0))
                         layer.layer_scale = scale_factor
-
+                    dirty_rect = dirty_rect.united(self.drag_layer_screen_rect(layer))
 
                 else:
                     # 普通图层拖动：移动图层位置
@@ -723,63 +922,104 @@ class Canvas(QLabel):
                         scene_pos.x() - layer.drag_offset.x(),
                         scene_pos.y() - layer.drag_offset.y()
                     )
+                    self.parent.update_layer_bbox(self.dragging_layer)
+                self._update_if_changed(layer, dirty_rect)
+    
+    def _state_key(self, layer):
+        """图层中影响绘制的状态：各类点、消失点、图层位置和缩放"""
+        return (layer,
+                tuple((p.x(), p.y()) for p in layer.selection_points),
+                tuple((p.x(), p.y()) for p in layer.points),
+                tuple((p.x(), p.y()) for p in layer.warp_points),
+                tuple((p.x(), p.y()) for p in self.parent.grid.primary_vp),
+                layer.position.x(), layer.position.y(),
+                layer.layer_position.x(), layer.layer_position.y(),
+                layer.layer_scale)
+    
+    def _update_if_changed(self, layer, rect=None):
+        """只在可见状态变化时请求重绘（拖动时坐标取整后常常不变）；rect为窗口坐标下的重绘区域"""
+        key = self._state_key(layer)
+        if key != self._last_state_hash:
+            self._last_state_hash = key
+            if rect is None:
                 self.update()
+            else:
+                self.update(rect)
     
-    def line_intersection(self, a1, a2, b1, b2):
-        """计算两条线的交点（用于透视约束）"""
-        x1, y1 = a1.x(), a1.y()
-        x2, y2 = a2.x(), a2.y()
-        x3, y3 = b1.x(), b1.y()
-        x4, y4 = b2.x(), b2.y()
-        
-        den = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
-        if den == 0:
-            return QPoint(x2, y2)  # 平行线，返回终点
-        
-        t_num = (x1 - x3) * (y3 - y4) - (y1 - y3) * (x3 - x4)
-        t = t_num / den
-        
-        x = x1 + t * (x2 - x1)
-        y = y1 + t * (y2 - y1)
-        
-        return QPoint(int(x), int(y))
+    def drag_layer_screen_rect(self, layer):
+        """拖拽图层在窗口坐标中占据的矩形（外扩2像素以覆盖取整误差）"""
+        scaled_width = layer.drag_layer_size[0] * layer.layer_scale
+        scaled_height = layer.drag_layer_size[1] * layer.layer_scale
+        # 与draw_layers中的绘制矩形一致
+        x = int(layer.layer_position.x() - scaled_width / 2)
+        y = int(layer.layer_position.y() - scaled_height / 2)
+        sf = self.scale_factor
+        left = math.floor(self.offset.x() + x * sf)
+        top = math.floor(self.offset.y() + y * sf)
+        right = math.ceil(self.offset.x() + (x + int(scaled_width)) * sf)
+        bottom = math.ceil(self.offset.y() + (y + int(scaled_height)) * sf)
+        return QRect(left, top, right - left, bottom - top).adjusted(-2, -2, 2, 2)
     
-    def get_point_along_line(self, start, end, length):
-        """沿直线从起点到终点方向移动指定长度"""
-        dx = end.x() - start.x()
-        dy = end.y() - start.y()
-        
-        if dx == 0 and dy == 0:
-            return end
-            
-        dist = np.sqrt(dx**2 + dy**2)
-        if dist == 0:
-            return end
-            
-        ratio = length / dist
-        x = end.x() + dx * ratio
-        y = end.y() + dy * ratio
-        
-        return QPoint(int(x), int(y))
+    def _flush_warp(self):
+        """按最新的拖动位置求解四边形并执行一次透视变换"""
+        self._warp_scheduled = False
+        if self._pending_warp is None:
+            return
+        layer, drag_idx, pos = self._pending_warp
+        self._pending_warp = None
+        
+        # 由拖动的角点和两个消失点确定整个四边形
+        vp1, vp2 = layer.source_vp[:2]
+        layer.warp_points[:4] = self._update_quad_from_corner(
+            drag_idx, pos, vp1, vp2, layer.original_width, layer.original_height)
+        layer.invalidate_points_cache()
+        
+        # 应用透视变换
+        self.parent.apply_perspective_to_layer(layer)
+        self._update_if_changed(layer)
+    
+    def _update_quad_from_corner(self, drag_idx, pos, vp1, vp2, w, h):
+        """根据拖动的角点和两个消失点求出2点透视下四边形的四个角点"""
+        quad = _solve_quad(drag_idx, pos.x(), pos.y(), vp1.x(), vp1.y(),
+                           vp2.x(), vp2.y(), w, h).tolist()
+        return [QPoint(quad[0], quad[1]), QPoint(quad[2], quad[3]),
+                QPoint(quad[4], quad[5]), QPoint(quad[6], quad[7])]
     
     def mouseReleaseEvent(self, event):
         """鼠标释放事件"""
         if event.button() == Qt.LeftButton:
+            if self.dragging_layer != -1:
+                # 拖动结束后把预览图像换成原分辨率
+                self.replace_drag_preview(self.parent.layers[self.dragging_layer])
             self.dragging_view = False
             self.dragging_point = -1
             self.dragging_edge = -1
             self.dragging_layer = -1
     
+    def replace_drag_preview(self, layer):
+        """把拖拽图层的降采样预览换成原分辨率图像，失败时保留预览"""
+        if not (layer.layer_drag_mode and layer._drag_is_preview):
+            return
+        preview_image = layer.drag_layer_image
+        self.copy_selection_to_drag_layer(layer)
+        if not layer.drag_layer_image:
+            layer.drag_layer_image = preview_image
+        self.update()
+    
     def wheelEvent(self, event):
         """鼠标滚轮事件，用于缩放"""
         current_layer = self.parent.get_current_layer()
+        self._last_state_hash = None  # 缩放不经过_update_if_changed，须重新比较
         
         # 图层拖拽模式下的缩放
         if current_layer and current_layer.layer_drag_mode and current_layer.drag_layer_image:
             factor = 1.1 if event.angleDelta().y() > 0 else 0.9
+            self.replace_drag_preview(current_layer)
+            old_rect = self.drag_layer_screen_rect(current_layer)
             current_layer.layer_scale *= factor
             current_layer.layer_scale = max(0.1, min(current_layer.layer_scale, 5.0))  # 限制缩放范围
-            self.update()
+            # 只重绘缩放前后图层覆盖的区域
+            self.update(old_rect.united(self.drag_layer_screen_rect(current_layer)))
             return
             
         # 普通视图缩放
@@ -809,29 +1049,26 @@ class Canvas(QLabel):
         current_layer.layer_drag_mode = not current_layer.layer_drag_mode
 
         if current_layer.layer_drag_mode:
-            # 复制选区内容到拖拽图层
-            self.copy_selection_to_drag_layer(current_layer)
+            # 复制选区内容到拖拽图层（先生成预览，空闲时或下次操作图层时再换成原分辨率）
+            self.copy_selection_to_drag_layer(current_layer, preview=self.interactive)
+            if current_layer._drag_is_preview:
+                QTimer.singleShot(0, lambda: self.replace_drag_preview(current_layer))
 
             if current_layer.drag_layer_image:
                 # 初始化图层位置和缩放
                 if len(current_layer.selection_points) == 4:
                     # 计算选区中心作为初始位置
-                    center_x = sum(p.x() for p in current_layer.selection_points) / 4
-                    center_y = sum(p.y() for p in current_layer.selection_points) / 4
+                    center_x, center_y = current_layer.selection_np().mean(axis=0)
                     current_layer.layer_position = QPoint(int(center_x), int(center_y))
                     current_layer.initial_center = current_layer.layer_position
 
                     if self.parent.grid.primary_vp and len(self.parent.grid.primary_vp) >= 2:
                         vp1 = self.parent.grid.primary_vp[0]
                         vp2 = self.parent.grid.primary_vp[1]
-                        # 计算到vp1的初始距离
-                        dx1 = current_layer.initial_center.x() - vp1.x()
-                        dy1 = current_layer.initial_center.y() - vp1.y()
-                        current_layer.initial_vp1_distance = np.sqrt(dx1 * dx1 + dy1 * dy1)
-                        # 计算到vp2的初始距离
-                        dx2 = current_layer.initial_center.x() - vp2.x()
-                        dy2 = current_layer.initial_center.y() - vp2.y()
-                        current_layer.initial_vp2_distance = np.sqrt(dx2 * dx2 + dy2 * dy2)
+                        cx, cy = current_layer.initial_center.x(), current_layer.initial_center.y()
+                        # 计算到vp1、vp2的初始距离（标量运算，不经过NumPy）
+                        current_layer.initial_vp1_distance = math.hypot(cx - vp1.x(), cy - vp1.y())
+                        current_layer.initial_vp2_distance = math.hypot(cx - vp2.x(), cy - vp2.y())
                     else:
                         current_layer.initial_vp1_distance = 1.0
                         current_layer.initial_vp2_distance = 1.0
@@ -846,21 +1083,52 @@ class Canvas(QLabel):
                 current_layer.layer_drag_mode = False
                 QMessageBox.warning(self, "警告", "无法复制选区内容")
     
-    def copy_selection_to_drag_layer(self, layer):
-        """复制四边形选区到拖拽图层 - 修复颜色问题"""
+    def commit_drag_layer(self):
+        """以高质量插值（Lanczos）重新生成当前拖拽图层"""
+        current_layer = self.parent.get_current_layer()
+        if not current_layer or not current_layer.layer_drag_mode:
+            QMessageBox.warning(self, "警告", "请先进入图层拖拽模式")
+            return
+        
+        previous_image = current_layer.drag_layer_image
+        self.interactive = False
+        try:
+            self.copy_selection_to_drag_layer(current_layer)
+        finally:
+            self.interactive = True
+        
+        if not current_layer.drag_layer_image:
+            # 高质量渲染失败时保留原来的预览图像，图层仍可继续拖拽
+            current_layer.drag_layer_image = previous_image
+            QMessageBox.warning(self, "警告", "无法复制选区内容")
+        self.update()
+    
+    def copy_selection_to_drag_layer(self, layer, preview=False):
+        """复制四边形选区到拖拽图层 - 修复颜色问题；preview为True时按drag_preview_scale降采样"""
         if len(layer.selection_points) != 4 or not self.pixmap:
             layer.drag_layer_image = None
             return
         
+        # 选区、背景和采样参数都没变时，上次的结果仍然有效
+        coords = tuple((p.x(), p.y()) for p in layer.selection_points)
+        copy_key = (coords, self.pixmap.cacheKey(),
+                    self.drag_preview_scale if preview else 1.0, self.interactive)
+        if layer.drag_layer_image and layer._drag_copy_key == copy_key:
+            return
+        
         try:
-            # 对点进行排序（左上、右上、右下、左下）
-            sorted_points = self.sort_points(layer.selection_points)
-            
-            # 计算四边形边界框
-            min_x = int(min(p.x() for p in sorted_points))
-            max_x = int(max(p.x() for p in sorted_points))
-            min_y = int(min(p.y() for p in sorted_points))
-            max_y = int(max(p.y() for p in sorted_points))
+            sel = layer.selection_np()
+            cache = layer._selection_cache
+            if cache is None or cache[0] != coords:
+                # 对点进行排序（左上、右上、右下、左下）
+                order = self.sort_order(sel)
+                
+                # 计算四边形边界框
+                (x0, y0), (x1, y1) = sel.min(axis=0).tolist(), sel.max(axis=0).tolist()
+                bbox = (x0, x1, y0, y1)
+                cache = layer._selection_cache = (coords, order, bbox)
+            order = cache[1]
+            min_x, max_x, min_y, max_y = cache[2]
             
             width = max_x - min_x
             height = max_y - min_y
@@ -869,54 +1137,69 @@ class Canvas(QLabel):
                 layer.drag_layer_image = None
                 return
             
-            # 创建一个与四边形边界框相同大小的RGBA图像
-            drag_layer = np.zeros((height, width, 4), dtype=np.uint8)
-            
             # 定义源四边形和目标四边形
-            src_points = np.float32([[p.x(), p.y()] for p in sorted_points])
+            src_points = sel[order].astype(np.float32)
             
             # 计算四边形在图层中的位置（相对于边界框）
-            layer_points = []
-            for point in sorted_points:
-                layer_x = point.x() - min_x
-                layer_y = point.y() - min_y
-                layer_points.append([layer_x, layer_y])
-            
-            dst_points = np.float32(layer_points)
+            dst_points = src_points - np.float32([min_x, min_y])
             
             # 计算透视变换矩阵
             matrix = cv2.getPerspectiveTransform(src_points, dst_points)
             
-            # 转换QPixmap为OpenCV图像
-            qimg = self.pixmap.toImage()
-            width_orig = qimg.width()
-            height_orig = qimg.height()
-            ptr = qimg.bits()
-            ptr.setsize(height_orig * width_orig * 4)
-            arr = np.frombuffer(ptr, np.uint8).reshape((height_orig, width_orig, 4))
+            # 预览时直接按比例缩小输出，需采样的像素数降为原来的 scale²
+            out_scale = self.drag_preview_scale if preview else 1.0
+            out_width, out_height = width, height
+            if out_scale < 1.0:
+                out_width = max(1, int(round(width * out_scale)))
+                out_height = max(1, int(round(height * out_scale)))
+                matrix = np.diag([out_width / width, out_height / height, 1.0]) @ matrix
+                dst_points = dst_points * np.float32([out_width / width, out_height / height])
             
-            # 直接使用RGBA格式，避免颜色转换问题
-            cv_img = cv2.cvtColor(arr, cv2.COLOR_RGBA2BGRA)
+            # 背景图的OpenCV图像在加载后已缓存
+            cv_img = self.source_array()
             
-            # 应用透视变换，保持原始颜色 - 关键修复
-            warped_image = cv2.warpPerspective(
-                cv_img, matrix, (width, height),
-                flags=cv2.INTER_LANCZOS4,  # 使用高质量插值
-                borderMode=cv2.BORDER_CONSTANT,
-                borderValue=(0, 0, 0, 0)
-            )
+            # 输出缓冲区尺寸不变时复用；当前显示的图像引用另一块缓冲区（_warped_np），两块交替使用
+            if layer._warp_buf is None or layer._warp_buf.shape != (out_height, out_width, 4):
+                layer._warp_buf = np.empty((out_height, out_width, 4), dtype=np.uint8)
             
-            # 转换回RGBA格式
-            warped_image = cv2.cvtColor(warped_image, cv2.COLOR_BGRA2RGBA)
+            # 矩阵为整数平移时（原分辨率复制总是如此），变换就是裁剪，直接拷贝像素
+            offset_x, offset_y = round(-matrix[0, 2]), round(-matrix[1, 2])
+            translation = np.array([[1, 0, -offset_x], [0, 1, -offset_y], [0, 0, 1]], dtype=np.float64)
+            if np.allclose(matrix, translation, atol=1e-6):
+                warped_image = self.crop_into(cv_img, offset_x, offset_y, layer._warp_buf)
+            else:
+                # 选区不变时复用上次的映射表，省去逐像素的矩阵运算
+                map_key = (out_width, out_height, matrix.tobytes())
+                if layer._drag_map_key != map_key:
+                    layer._drag_map1, layer._drag_map2 = build_perspective_maps(matrix, (out_width, out_height))
+                    layer._drag_map_key = map_key
+                
+                # 应用透视变换，保持原始颜色 - 关键修复；BORDER_CONSTANT会写满每个像素，无需清零
+                warped_image = cv2.remap(
+                    cv_img, layer._drag_map1, layer._drag_map2,
+                    cv2.INTER_LINEAR if self.interactive else cv2.INTER_LANCZOS4,
+                    dst=layer._warp_buf,
+                    borderMode=cv2.BORDER_CONSTANT,
+                    borderValue=(0, 0, 0, 0)
+                )
             
             # 创建一个掩码来标识四边形区域
-            mask = np.zeros((height, width), dtype=np.uint8)
+            # Alpha通道视图不连续，fillConvexPoly无法直接写入，改为复用同尺寸的掩码缓冲区
+            mask = layer._mask_buf
+            if mask is None or mask.shape != (out_height, out_width):
+                mask = layer._mask_buf = np.zeros((out_height, out_width), dtype=np.uint8)
+            else:
+                mask.fill(0)
             cv2.fillConvexPoly(mask, dst_points.astype(np.int32), 255)
             
+            # 预乘Alpha：掩码只有0和255，预乘即把选区外的颜色清零
+            np.bitwise_and(warped_image, mask[:, :, None], out=warped_image)
+            
             # 设置Alpha通道为掩码
             warped_image[:, :, 3] = mask
             
-            # 转换回QImage
+            # 转换回QImage；ARGB32_Premultiplied是Qt绘制时的原生格式，内存字节序为BGRA，
+            # 与remap输出的通道顺序一致，因此不再需要BGRA2RGBA转换
             height_drag, width_drag, channels_drag = warped_image.shape
             bytes_per_line = channels_drag * width_drag
             
@@ -925,33 +1208,41 @@ class Canvas(QLabel):
                 width_drag, 
                 height_drag, 
                 bytes_per_line, 
-                QImage.Format_RGBA8888
+                QImage.Format_ARGB32_Premultiplied
             )
             
-            # 创建深拷贝，避免数据被释放
-            layer.drag_layer_image = q_img.copy()
+            # 不再深拷贝：保留像素缓冲区的引用，旧图像的缓冲区留作下次的输出
+            layer._warp_buf, layer._warped_np = layer._warped_np, warped_image
+            layer.drag_layer_image = q_img
+            layer.drag_layer_size = (width, height)
+            layer._drag_is_preview = out_width != width or out_height != height
+            layer._drag_copy_key = copy_key
             
         except Exception as e:
             print(f"复制四边形区域失败: {str(e)}")
             layer.drag_layer_image = None
     
-    def sort_points(self, points):
-        """对点进行排序（左上、右上、右下、左下）"""
+    @staticmethod
+    def crop_into(src, x, y, out):
+        """把src中以(x, y)为左上角、与out同尺寸的区域拷入out，超出src的部分填0"""
+        out_height, out_width = out.shape[:2]
+        src_height, src_width = src.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + out_width, src_width), min(y + out_height, src_height)
+        if x0 > x or y0 > y or x1 < x + out_width or y1 < y + out_height:
+            out.fill(0)
+        if x0 < x1 and y0 < y1:
+            out[y0 - y:y1 - y, x0 - x:x1 - x] = src[y0:y1, x0:x1]
+        return out
+    
+    @staticmethod
+    def sort_order(pts):
+        """(4,2)点数组按相对中心的角度排序后的下标"""
         # 计算中心点
-        center_x = sum(p.x() for p in points) / 4
-        center_y = sum(p.y() for p in points) / 4
-        
-        # 计算每个点相对于中心的角度
-        angles = []
-        for point in points:
-            angle = np.arctan2(point.y() - center_y, point.x() - center_x)
-            angles.append(angle)
+        center = pts.mean(axis=0)
         
-        # 按角度排序
-        sorted_indices = np.argsort(angles)
-        sorted_points = [points[i] for i in sorted_indices]
-        
-        return sorted_points
+        # 一次计算所有点相对于中心的角度，按角度排序
+        return np.argsort(np.arctan2(pts[:, 1] - center[1], pts[:, 0] - center[0]))
 
 class VanishingPointEditor(QMainWindow):
     """消失点编辑器主窗口"""
@@ -962,6 +1253,8 @@ class VanishingPointEditor(QMainWindow):
         self.current_layer_idx = -1  # 当前图层索引
         self.grid = PerspectiveGrid()  # 透视网格
         self.control_point_mode = False  # 控制点标记模式（已合并选区功能）
+        self._layer_bboxes = None  # 各图层包围盒 (N,4)，与layers顺序一致，None表示需重建
+        self._layer_visible = None  # 各图层是否可参与点击检测 (N,)
         # 再初始化界面
         self.init_ui()
         
@@ -1014,6 +1307,8 @@ class VanishingPointEditor(QMainWindow):
         # 图层拖拽按钮
         self.layer_drag_btn = QPushButton("图层拖拽")
         self.layer_drag_btn.clicked.connect(self.toggle_layer_drag_mode)
+        self.commit_drag_btn = QPushButton("高质量渲染")
+        self.commit_drag_btn.clicked.connect(self.commit_drag_layer)
         
         # 图层上下移按钮
         self.layer_up_btn = QPushButton("图层上移")
@@ -1040,6 +1335,7 @@ class VanishingPointEditor(QMainWindow):
         tool_layout.addWidget(self.grid_density_label)
         tool_layout.addWidget(self.grid_density_btn)
         tool_layout.addWidget(self.layer_drag_btn)
+        tool_layout.addWidget(self.commit_drag_btn)
         tool_layout.addWidget(self.scale_up_btn)
         tool_layout.addWidget(self.scale_down_btn)
         tool_layout.addStretch()
@@ -1075,16 +1371,22 @@ class VanishingPointEditor(QMainWindow):
 
         self.canvas.toggle_layer_drag_mode()
     
+    def commit_drag_layer(self):
+        """高质量渲染当前拖拽图层"""
+        self.canvas.commit_drag_layer()
+    
     def move_layer_up(self):
         """将当前图层上移"""
         if self.current_layer_idx >= 0 and self.current_layer_idx < len(self.layers) - 1:
+            layers = self.layers
+            idx = self.current_layer_idx
             # 交换z_order
-            self.layers[self.current_layer_idx].z_order += 1
-            self.layers[self.current_layer_idx + 1].z_order -= 1
+            layers[idx].z_order += 1
+            layers[idx + 1].z_order -= 1
             
             # 交换列表中的位置
-            self.layers[self.current_layer_idx], self.layers[self.current_layer_idx + 1] = \
-            self.layers[self.current_layer_idx + 1], self.layers[self.current_layer_idx]
+            layers[idx], layers[idx + 1] = layers[idx + 1], layers[idx]
+            self.invalidate_layer_bboxes()
             
             # 更新列表
             self.update_layer_list()
@@ -1095,13 +1397,15 @@ class VanishingPointEditor(QMainWindow):
     def move_layer_down(self):
         """将当前图层下移"""
         if self.current_layer_idx > 0 and self.current_layer_idx < len(self.layers):
+            layers = self.layers
+            idx = self.current_layer_idx
             # 交换z_order
-            self.layers[self.current_layer_idx].z_order -= 1
-            self.layers[self.current_layer_idx - 1].z_order += 1
+            layers[idx].z_order -= 1
+            layers[idx - 1].z_order += 1
             
             # 交换列表中的位置
-            self.layers[self.current_layer_idx], self.layers[self.current_layer_idx - 1] = \
-            self.layers[self.current_layer_idx - 1], self.layers[self.current_layer_idx]
+            layers[idx], layers[idx - 1] = layers[idx - 1], layers[idx]
+            self.invalidate_layer_bboxes()
             
             # 更新列表
             self.update_layer_list()
@@ -1119,9 +1423,21 @@ class VanishingPointEditor(QMainWindow):
         """将透视变换应用到图层 - 修复黑色区域问题"""
         if not layer.original_image or not layer.warp_points or len(layer.warp_points) != 4:
             return
+        
+        # 同一原图和同一组控制点的变换结果直接从QPixmapCache取出（来回拖动时常见）
+        warp = layer.warp_np()
+        cache_key = "warp:%d:%s" % (layer.original_image.cacheKey(), warp.tolist())
+        min_x, min_y = warp.min(axis=0).tolist()
+        cached = QPixmapCache.find(cache_key)
+        if cached is not None:
+            layer.warped_image = cached
+            layer.position = QPoint(min_x, min_y)
+            layer.update_bbox()
+            self.invalidate_layer_bboxes()
+            return
             
         # 获取变换控制点
-        dst_points = np.float32([[p.x(), p.y()] for p in layer.warp_points])
+        dst_points = warp.astype(np.float32)
         
         # 原始图像的四个角
         w = layer.original_image.width()
@@ -1131,38 +1447,36 @@ class VanishingPointEditor(QMainWindow):
         # 计算透视变换矩阵
         matrix = cv2.getPerspectiveTransform(src_points, dst_points)
         
-        # 转换QImage为OpenCV图像（带Alpha通道）
-        qimg = layer.original_image
-        width = qimg.width()
-        height = qimg.height()
-        ptr = qimg.bits()
-        ptr.setsize(height * width * 4)
-        arr = np.frombuffer(ptr, np.uint8).reshape((height, width, 4))
-        
-        # 直接使用RGBA格式，避免颜色转换问题
-        cv_img = cv2.cvtColor(arr, cv2.COLOR_RGBA2BGRA)
+        # 原图的OpenCV图像（带Alpha通道）按原图缓存
+        cv_img = layer.original_array()
         
         # 计算输出图像的大小和偏移（修复黑色区域关键）
-        all_points = np.float32([[p.x(), p.y()] for p in layer.warp_points])
-        min_x, min_y = np.int32(all_points.min(axis=0))
-        max_x, max_y = np.int32(all_points.max(axis=0))
+        max_x, max_y = warp.max(axis=0).tolist()
         
         out_width = max(1, int(max_x - min_x))
         out_height = max(1, int(max_y - min_y))
         
-        # 调整变换矩阵以消除偏移
-        translation = np.array([[1, 0, -min_x], [0, 1, -min_y], [0, 0, 1]], dtype=np.float32)
-        adjusted_matrix = translation @ matrix
-        
-        # 应用透视变换，使用边缘填充而非黑色填充
-        transformed_cv = cv2.warpPerspective(
-            cv_img, adjusted_matrix, (out_width, out_height),
+        # 调整变换矩阵以消除偏移：左乘平移矩阵只改变前两行
+        adjusted_matrix = matrix.copy()
+        adjusted_matrix[0] -= min_x * matrix[2]
+        adjusted_matrix[1] -= min_y * matrix[2]
+        
+        # 透视矩阵或输出尺寸变化时才重建映射表，否则直接复用
+        out_size = (out_width, out_height)
+        if (layer._map1 is None or layer._map_size != out_size or
+                not np.allclose(layer._map_matrix, adjusted_matrix, rtol=1e-6, atol=1e-9)):
+            layer._map1, layer._map2 = build_perspective_maps(adjusted_matrix, out_size)
+            layer._map_matrix = adjusted_matrix
+            layer._map_size = out_size
+        
+        # 应用透视变换，映射到源图像外的像素保持透明
+        transformed_cv = np.zeros((out_height, out_width, 4), dtype=np.uint8)
+        cv2.remap(
+            cv_img, layer._map1, layer._map2, cv2.INTER_LINEAR,
+            dst=transformed_cv,
             borderMode=cv2.BORDER_TRANSPARENT  # 关键修复：使用透明填充而非黑色
         )
         
-        # 转换回RGBA格式
-        transformed_cv = cv2.cvtColor(transformed_cv, cv2.COLOR_BGRA2RGBA)
-        
         # 转换回QImage（保留Alpha通道）
         q_img = QImage(
             transformed_cv.data, 
@@ -1173,8 +1487,12 @@ class VanishingPointEditor(QMainWindow):
         )
         
         # 更新图层的变换后图像和位置（使用计算出的最小坐标）
-        layer.warped_image = q_img
+        pixmap = QPixmap.fromImage(q_img)
+        QPixmapCache.insert(cache_key, pixmap)
+        layer.warped_image = pixmap
         layer.position = QPoint(min_x, min_y)
+        layer.update_bbox()
+        self.invalidate_layer_bboxes()
     
     def add_layer(self, name=None):
         """添加新图层"""
@@ -1186,6 +1504,7 @@ class VanishingPointEditor(QMainWindow):
         new_layer = PerspectiveLayer(name)
         new_layer.z_order = len(self.layers)
         self.layers.append(new_layer)
+        self.invalidate_layer_bboxes()
         self.update_layer_list()
         self.current_layer_idx = len(self.layers) - 1
         self.layer_list.setCurrentRow(self.current_layer_idx)
@@ -1202,13 +1521,45 @@ class VanishingPointEditor(QMainWindow):
         )
         
         if file_path:
-            # 加载图片到图层
-            current_layer.original_image = QImage(file_path)
-            current_layer.warped_image = QImage(file_path)
+            # 加载图片到图层，统一转为RGBA8888，透视变换时可直接按字节使用
+            current_layer.original_image = QImage(file_path).convertToFormat(QImage.Format_RGBA8888)
+            current_layer.warped_image = current_layer.original_image
+            current_layer.update_bbox()
+            self.invalidate_layer_bboxes()
             
             # 如果是第一个有图片的图层，设置为画布背景
             if self.canvas.pixmap.isNull():
-                self.canvas.load_image(file_path)
+                self.canvas.load_image(file_path, current_layer.warped_image)
+    
+    def layer_hit_arrays(self):
+        """返回按layers顺序排列的包围盒数组和可见性数组，必要时重建"""
+        if self._layer_bboxes is None:
+            n = len(self.layers)
+            bboxes = np.zeros((n, 4), np.int64)
+            visible = np.zeros(n, bool)
+            for i, layer in enumerate(self.layers):
+                if layer._bbox:
+                    bboxes[i] = layer._bbox
+                    visible[i] = layer.visible
+            self._layer_bboxes = bboxes
+            self._layer_visible = visible
+        return self._layer_bboxes, self._layer_visible
+    
+    def invalidate_layer_bboxes(self):
+        """图层增删、换序或图像变化后调用"""
+        self._layer_bboxes = None
+        self._layer_visible = None
+    
+    def update_layer_bbox(self, idx):
+        """图层移动后只更新包围盒数组中对应的一行"""
+        layer = self.layers[idx]
+        layer.update_bbox()
+        if self._layer_bboxes is not None:
+            if layer._bbox:
+                self._layer_bboxes[idx] = layer._bbox
+                self._layer_visible[idx] = layer.visible
+            else:
+                self._layer_visible[idx] = False
     
     def get_current_layer(self):
         """获取当前选中的图层"""
@@ -1226,6 +1577,7 @@ class VanishingPointEditor(QMainWindow):
         if current_layer:
             current_layer.points = []
             current_layer.selection_points = []  # 同时清除选区
+            current_layer.invalidate_points_cache()
             self.grid.primary_vp = []
             self.canvas.update()
     
@@ -1280,38 +1632,57 @@ class VanishingPointEditor(QMainWindow):
         
         for layer in sorted_layers:
             if layer.visible:
+                # 每个图层的属性只读取一次
+                drag_mode = layer.layer_drag_mode
+                drag_image = layer.drag_layer_image
+                warped_image = layer.warped_image
+                
                 # 保存当前变换状态
                 painter.save()
                 
-                if layer.layer_drag_mode and layer.drag_layer_image:
+                if drag_mode and drag_image:
                     # 图层拖拽模式：绘制拖拽图层
-                    center_x = layer.layer_position.x()
-                    center_y = layer.layer_position.y()
+                    center = layer.layer_position
+                    scale = layer.layer_scale
                     
                     # 计算缩放后的图像尺寸
-                    scaled_width = layer.drag_layer_image.width() * layer.layer_scale
-                    scaled_height = layer.drag_layer_image.height() * layer.layer_scale
+                    scaled_width = layer.drag_layer_size[0] * scale
+                    scaled_height = layer.drag_layer_size[1] * scale
                     
                     # 计算绘制位置（使图像中心对准图层位置）
-                    draw_x = center_x - scaled_width / 2
-                    draw_y = center_y - scaled_height / 2
+                    draw_x = center.x() - scaled_width / 2
+                    draw_y = center.y() - scaled_height / 2
                     
-                    # 绘制缩放后的图像
+                    # 绘制缩放后的图像；缩放比例变化超过0.01才重新缩放，其余帧只是贴图
                     scaled_rect = QRect(int(draw_x), int(draw_y), 
                                       int(scaled_width), int(scaled_height))
-                    painter.drawImage(scaled_rect, layer.drag_layer_image)
+                    key = layer._scaled_key
+                    if (key is None or key[0] != drag_image.cacheKey() or
+                            abs(key[1] - scale) > 0.01):
+                        layer._scaled_pixmap = QPixmap.fromImage(drag_image).scaled(
+                            max(1, scaled_rect.width()), max(1, scaled_rect.height()),
+                            Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+                        layer._scaled_key = (drag_image.cacheKey(), scale)
+                    painter.drawPixmap(scaled_rect, layer._scaled_pixmap)
                 
                 # 绘制普通图层（无论是否在拖拽模式）
-                if layer.warped_image and not layer.layer_drag_mode:
+                if warped_image and not drag_mode:
                     painter.setOpacity(layer.opacity)
-                    painter.drawImage(layer.position, layer.warped_image)
+                    if isinstance(warped_image, QPixmap):
+                        painter.drawPixmap(layer.position, warped_image)
+                    else:
+                        painter.drawImage(layer.position, warped_image)
                     painter.setOpacity(1.0)  # 重置透明度
                 
                 # 恢复变换状态
                 painter.restore()
 
 if __name__ == "__main__":
+    # 为OpenCV的并行变换保留一个核心给界面线程
+    cv2.setNumThreads(max(1, (os.cpu_count() or 1) - 1))
     app = QApplication(sys.argv)
+    # 默认10MB放不下几张大图的变换结果
+    QPixmapCache.setCacheLimit(64 * 1024)
     window = VanishingPointEditor()
     window.show()
     sys.exit(app.exec_())
\ No newline at end of file